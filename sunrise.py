@@ -1,122 +1,238 @@
-#!/usr/bin/python
+#!/usr/bin/python3
+import array
 import collections
 import datetime
+import functools
 import math
+import sys
+
+try:
+    # glibc computes sin and cos of the same angle in one go
+    import ctypes
+    _libm_sincos = ctypes.CDLL("libm.so.6").sincos
+    _libm_sincos.restype = None
+    _libm_sincos.argtypes = [ctypes.c_double, ctypes.POINTER(ctypes.c_double), ctypes.POINTER(ctypes.c_double)]
+    def _sincos(x):
+        s = ctypes.c_double()
+        c = ctypes.c_double()
+        _libm_sincos(x, ctypes.byref(s), ctypes.byref(c))
+        return (s.value, c.value)
+except (ImportError, OSError, AttributeError):
+    def _sincos(x, _sin=math.sin, _cos=math.cos):
+        return (_sin(x), _cos(x))
 
 TAU = math.pi * 2
+HALF_TAU = TAU / 2
+HOUR_ANGLE = TAU / 24
+MINUTE_ANGLE = TAU / (24 * 60)
+GAMMA_PER_DAY = TAU / 365.25
+SECONDS_PER_RADIAN = 86400 / TAU
 DAYS_PER_YEAR = 365.25
+Y2K_ORDINAL = datetime.date(2000, 1, 1).toordinal()
 
-lightness_limit = collections.namedtuple("lightness_limit", ["id", "angle", "nameup", "namedown", "description"])
+lightness_limit = collections.namedtuple("lightness_limit", ["id", "angle", "angle_rad", "sin_angle_rad", "nameup", "namedown", "description"])
+def _make_limit(id, angle, nameup, namedown, description):
+    angle_rad = math.radians(angle)
+    return lightness_limit(id, angle, angle_rad, math.sin(angle_rad), nameup, namedown, description)
 limits = [
-    lightness_limit("horizontal", 0, "horizontal sunrise", "horizontal sunset", "center of the true location of the sun on the horizon"),
-    lightness_limit("sunrise", 0.83, "sunrise", "sunset", "apparent sunset accounts for refraction and radius of the sun"),
-    lightness_limit("civil", 6, "civil dawn", "civil dusk", "sufficient light to work by"),
-    lightness_limit("naval", 12, "naval dawn", "naval dusk", "sufficient light to see the horizon"),
-    lightness_limit("astronomical", 18, "astronomical dawn", "astronomical dusk", "sufficient light to spoil astronomical observations")
+    _make_limit("horizontal", 0, "horizontal sunrise", "horizontal sunset", "center of the true location of the sun on the horizon"),
+    _make_limit("sunrise", 0.83, "sunrise", "sunset", "apparent sunset accounts for refraction and radius of the sun"),
+    _make_limit("civil", 6, "civil dawn", "civil dusk", "sufficient light to work by"),
+    _make_limit("naval", 12, "naval dawn", "naval dusk", "sufficient light to see the horizon"),
+    _make_limit("astronomical", 18, "astronomical dawn", "astronomical dusk", "sufficient light to spoil astronomical observations")
 ]
-limits = collections.OrderedDict(sorted(zip(map(lambda x: x.id, limits), limits), key=lambda k: k[1].angle))
+# the entries above are listed in increasing angle order already
+limits = {limit.id: limit for limit in limits}
+LIMIT_CHOICES = list(limits.keys()) + ["all"]
+
+def _year_angle(ordinal):
+    # fractional year angle straight from the date ordinal; counting
+    # from the y2k epoch modulo the mean year avoids both the
+    # struct_time/date allocations and the quarter-day phase jump a
+    # per-calendar-year day count has at new year
+    return (ordinal - Y2K_ORDINAL) % DAYS_PER_YEAR * GAMMA_PER_DAY
+
+# declination and equation of time from the NOAA/Spencer Fourier series
+# in the fractional year angle gamma
+def _gamma_harmonics(s1, c1):
+    # 2x/3x harmonics of the year angle by recurrence from one sincos;
+    # shared by declination, EoT and any future solar-position terms
+    s2 = 2 * s1 * c1
+    c2 = c1 * c1 - s1 * s1
+    return (s1, c1, s2, c2, s1 * c2 + c1 * s2, c1 * c2 - s1 * s2)
 
-def rad_from_deg(degrees):
-    return degrees / 360.0 * TAU
-def deg_from_rad(radians):
-    return radians / TAU * 360
+def _solar_fourier_core(s1, c1, s2, c2, s3, c3):
+    decl = 0.006918 - 0.399912 * c1 + 0.070257 * s1 - 0.006758 * c2 + 0.000907 * s2 - 0.002697 * c3 + 0.00148 * s3
+    eot_minutes = 229.18 * (0.000075 + 0.001868 * c1 - 0.032077 * s1 - 0.014615 * c2 - 0.040849 * s2)
+    return (decl, eot_minutes * MINUTE_ANGLE)
+
+# declination/EoT sampled across the year for interpolated lookups;
+# ~5-day spacing keeps the interpolation error far below the 0.83
+# degree refraction term
+_LUT_N = 73
+def _build_luts():
+    decl_lut = array.array('d')
+    eot_lut = array.array('d')
+    for i in range(_LUT_N + 1):
+        gamma = TAU * i / _LUT_N
+        decl, eot = _solar_fourier_core(*_gamma_harmonics(*_sincos(gamma)))
+        decl_lut.append(decl)
+        eot_lut.append(eot)
+    return (decl_lut, eot_lut)
+_DECL_LUT, _EOT_LUT = _build_luts()
+
+@functools.lru_cache(maxsize=1024)
+def _solar_fourier(ordinal):
+    # (decl, sin(decl), cos(decl), eot); the declination sincos is
+    # cached here so the per-limit hour-angle formula can reuse it
+    gamma = _year_angle(ordinal)
+    t = (gamma % TAU) / TAU * _LUT_N
+    i = int(t)
+    f = t - i
+    decl = _DECL_LUT[i] * (1 - f) + _DECL_LUT[i+1] * f
+    eot = _EOT_LUT[i] * (1 - f) + _EOT_LUT[i+1] * f
+    sin_decl, cos_decl = _sincos(decl)
+    return (decl, sin_decl, cos_decl, eot)
 
 def equation_of_time(date):
-    w = TAU / DAYS_PER_YEAR
-    d = date.timetuple().tm_yday
-    a = w * (d + 10)
-    b = a + 2 * 0.0167 * math.sin(w * (d - 2))
-    c = (a - math.atan(math.tan(b)/math.cos(rad_from_deg(23.44))))/(TAU/2)
-    return (c - round(c)) * TAU/2
+    return _solar_fourier(date.toordinal())[3]
 
 def solar_declination(date):
-    crude_jd = date.toordinal()
-    crude_y2k_jd = datetime.date(2000,1,1).toordinal()
-    d_since_y2k = crude_jd - crude_y2k_jd
-    earth_anomalies = (rad_from_deg(357.5291), rad_from_deg(0.98560028))
-    m = earth_anomalies[0] + earth_anomalies[1] * d_since_y2k
-    m %= TAU
-    earth_centers = (rad_from_deg(1.9148), rad_from_deg(0.02), rad_from_deg(0.0003))
-    c = earth_centers[0] * math.sin(m) + earth_centers[1] * math.sin(m*2) + earth_centers[2] * math.sin(m*3)
-    v = m + c
-    earth_peri = rad_from_deg(102.9372)
-    earth_obliq = rad_from_deg(23.45)
-    l = v + earth_peri
-    l_sun = l + TAU/2
-    l_sun %= TAU
-    earth_a = (rad_from_deg(-2.4680), rad_from_deg(0.0530), rad_from_deg(-0.0014))
-    earth_d = (rad_from_deg(22.8008), rad_from_deg(0.5999), rad_from_deg(0.0493))
-    a_sun = l_sun + earth_a[0] * math.sin(2 * l_sun) + earth_a[1] * math.sin(4 * l_sun) + earth_a[2] * math.sin(6 * l_sun)
-    d_sun = earth_d[0] * math.sin(l_sun) + earth_d[1] * math.sin(l_sun)**3 + earth_d[2] * math.sin(l_sun)**5
-    return d_sun
-
-def time_angle_to_hms(time_angle):
-    day_frac = time_angle/TAU
-    day_frac %= 1
-    hour_frac, hours = math.modf(day_frac * 24)
-    min_frac, minutes = math.modf(hour_frac*60)
-    seconds = min_frac * 60
-    return (int(hours), int(minutes), seconds)
-
-def print_hour_angle(angle, fmt="{0}"):
-    (hours, minutes, seconds) = time_angle_to_hms(angle)
-    formatted = "{0:02}:{1:02}:{2:02}".format(hours, minutes, int(seconds))
-    print(fmt.format(formatted))
-
-def print_limits(date, limit, latitude, longtitude, times=None, verbose=0):
-    if not times:
-        times = {"utc":None}
-    print("Calculating {1} limits for {0}".format(date.isoformat(), limit.id))
-    sun_decl = solar_declination(date)
-    if verbose > 0:
-        print("Using sun decl {0} rad (= {1} degrees)".format(sun_decl, deg_from_rad(sun_decl)))
-    sun_angle = -rad_from_deg(limit.angle)
-    cos_of_hour = (math.sin(sun_angle) - math.sin(latitude) * math.sin(sun_decl)) / (math.cos(latitude) * math.cos(sun_decl))
-    if verbose > 1:
-        print("cos(hour): {0}".format(cos_of_hour))
-    if verbose > 0:
-        print_hour_angle(-equation_of_time(date), "Equation of time: adjusting noon by {0}")
-    print
+    return _solar_fourier(date.toordinal())[0]
+
+def _year_angles(ordinals):
+    import numpy as np
+    return (np.asarray(ordinals) - Y2K_ORDINAL) % DAYS_PER_YEAR * GAMMA_PER_DAY
+
+def _solar_fourier_vec(dates):
+    import numpy as np
+    gamma = _year_angles([date.toordinal() for date in dates])
+    return _solar_fourier_core(*_gamma_harmonics(np.sin(gamma), np.cos(gamma)))
+
+def equation_of_time_vec(dates):
+    # vectorized equation_of_time for a sequence of datetime.dates
+    return _solar_fourier_vec(dates)[1]
+
+def solar_declination_vec(dates):
+    # vectorized solar_declination for a sequence of datetime.dates
+    return _solar_fourier_vec(dates)[0]
+
+def _hour_angle_safe(cos_of_hour):
+    # clamp away |cos| just past 1.0 so acos never raises; polar
+    # day/night is decided by the caller
+    return math.acos(min(1.0, max(-1.0, cos_of_hour)))
+
+def hour_angle_vec(sun_decl, sun_angle, latitude):
+    # vectorized hour angle between noon and the sun passing sun_angle,
+    # NaN where the sun never reaches it (polar day/night)
+    import numpy as np
+    cos_of_hour = (np.sin(sun_angle) - np.sin(latitude) * np.sin(sun_decl)) / (np.cos(latitude) * np.cos(sun_decl))
+    polar = np.abs(cos_of_hour) > 1.0
+    return np.where(polar, np.nan, np.arccos(np.clip(cos_of_hour, -1.0, 1.0)))
+
+_batch_kernel = None
+def _get_batch_kernel():
+    # numba is slow to import and only pays off in batch mode, so the
+    # kernel is compiled on first use rather than at module import
+    global _batch_kernel
+    if _batch_kernel is None:
+        try:
+            import numba
+            import numpy
+        except ImportError:
+            _batch_kernel = False
+            return None
+        harmonics = numba.njit(cache=True, fastmath=True)(_gamma_harmonics)
+        fourier = numba.njit(cache=True, fastmath=True)(_solar_fourier_core)
+        hour_angle_safe = numba.njit(cache=True, fastmath=True)(_hour_angle_safe)
+        @numba.njit(fastmath=True, parallel=True)
+        def kernel(gamma, sin_lat, cos_lat, longtitude, sin_angle):
+            rise = numpy.empty(gamma.shape[0])
+            sset = numpy.empty(gamma.shape[0])
+            for i in numba.prange(gamma.shape[0]):
+                s1, c1, s2, c2, s3, c3 = harmonics(math.sin(gamma[i]), math.cos(gamma[i]))
+                sun_decl, eot = fourier(s1, c1, s2, c2, s3, c3)
+                cos_of_hour = (sin_angle - sin_lat * math.sin(sun_decl)) / (cos_lat * math.cos(sun_decl))
+                noon_utc = HALF_TAU - longtitude - eot
+                hour_angle = hour_angle_safe(cos_of_hour)
+                polar = cos_of_hour * cos_of_hour > 1.0
+                rise[i] = math.nan if polar else noon_utc - hour_angle
+                sset[i] = math.nan if polar else noon_utc + hour_angle
+            return (rise, sset)
+        _batch_kernel = kernel
+    return _batch_kernel or None
+
+def sunrise_batch(ordinals, latitude, longtitude, sun_angle):
+    # sunrise/sunset UTC time angles for a sequence of date ordinals;
+    # NaN marks polar day/night
+    import numpy as np
+    gamma = _year_angles(ordinals)
+    kernel = _get_batch_kernel()
+    if kernel is not None:
+        sin_lat, cos_lat = _sincos(latitude)
+        return kernel(gamma, sin_lat, cos_lat, longtitude, math.sin(sun_angle))
+    sun_decl, eot = _solar_fourier_core(*_gamma_harmonics(np.sin(gamma), np.cos(gamma)))
+    hour_angle = hour_angle_vec(sun_decl, sun_angle, latitude)
+    noon_utc = HALF_TAU - longtitude - eot
+    return (noon_utc - hour_angle, noon_utc + hour_angle)
+
+def sunrise_range(start_date, n_days, latitude, longtitude, sun_angle):
+    # sunrise_batch over n_days consecutive days starting at start_date
+    import numpy as np
+    start = start_date.toordinal()
+    return sunrise_batch(np.arange(start, start + n_days), latitude, longtitude, sun_angle)
+
+def format_hour_angle(angle, prefix="", suffix=""):
+    # hms split fused into the formatter so no intermediate tuple is built
+    total_seconds = int((angle % TAU) * SECONDS_PER_RADIAN)
+    hours, rest = divmod(total_seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{prefix}{hours:02}:{minutes:02}:{seconds:02}{suffix}"
+
+def format_limits(date, limit, sin_lat, cos_lat, times, verbose=0):
+    out = []
+    out.append(f"Calculating {limit.id} limits for {date.isoformat()}")
+    sun_decl, sin_decl, cos_decl, _ = _solar_fourier(date.toordinal())
+    if __debug__ and verbose > 0:
+        out.append(f"Using sun decl {sun_decl} rad (= {math.degrees(sun_decl)} degrees)")
+    cos_of_hour = (-limit.sin_angle_rad - sin_lat * sin_decl) / (cos_lat * cos_decl)
+    if __debug__ and verbose > 1:
+        out.append(f"cos(hour): {cos_of_hour}")
+    if __debug__ and verbose > 0:
+        out.append(format_hour_angle(-equation_of_time(date), "Equation of time: adjusting noon by "))
     if cos_of_hour > 1.0:
-        print("Polar night")
+        out.append("Polar night")
     elif cos_of_hour < -1.0:
-        print("Polar day")
+        out.append("Polar day")
     else:
-        hour_angle = math.acos(cos_of_hour)
-        noon_local = TAU/2
-        noon_mean = TAU/2 - equation_of_time(date)
-        noon_utc = TAU/2 - longtitude - equation_of_time(date)
+        hour_angle = _hour_angle_safe(cos_of_hour)
 
         # These calculations are probably wrong
         noon_tabs = "\t" * ((len(limit.nameup) - 7) // 8 + 2)
         tabs = "\t" * ((len(limit.nameup) < 8) + 1)
-        for (timeformat, val) in times.items():
-            if timeformat == "solar":
-                values = (noon_local, "solar time")
-            elif timeformat == "mean":
-                values = (noon_mean, "mean solar time")
-            elif timeformat == "utc":
-                values = (noon_utc, "UTC")
-            elif timeformat == "zone":
-                zone_corr = val / 24. * TAU
-                noon_zone = noon_utc + zone_corr
-                values = (noon_zone, "{tz:+03}".format(tz=val))
-            sunrise = values[0] - hour_angle
-            sunset = values[0] + hour_angle
-            print_hour_angle(sunrise, "{limitname}{tabs}{{}} {timename}".format(limitname=limit.nameup.capitalize(), timename=values[1], tabs=tabs))
-            print_hour_angle(values[0], "Noon{tabs}{{}} {timename}".format(tabs=noon_tabs, timename=values[1]))
-            print_hour_angle(sunset, "{limitname}{tabs}{{}} {timename}".format(limitname=limit.namedown.capitalize(), timename=values[1], tabs=tabs))
+        up_prefix = limit.nameup.capitalize() + tabs
+        noon_prefix = "Noon" + noon_tabs
+        down_prefix = limit.namedown.capitalize() + tabs
+        for (noon, timename) in times:
+            suffix = " " + timename
+            out.append(format_hour_angle(noon - hour_angle, up_prefix, suffix))
+            out.append(format_hour_angle(noon, noon_prefix, suffix))
+            out.append(format_hour_angle(noon + hour_angle, down_prefix, suffix))
+    return out
+
+def print_limits(date, limit, sin_lat, cos_lat, times, verbose=0):
+    sys.stdout.write("\n".join(format_limits(date, limit, sin_lat, cos_lat, times, verbose)) + "\n")
 
 if __name__ == "__main__":
-    import sys
     import argparse
     ap = argparse.ArgumentParser(description="Sunrise calculator")
     ap.add_argument("-d", "--date", help="use given date rather than current time")
+    ap.add_argument("--range", nargs=2, metavar=("START", "END"), help="print a table of times (UTC) for every day from START to END")
     ap.add_argument("-s", "--solar", action="store_true", help="show time in solar time")
     ap.add_argument("-m", "--mean", action="store_true", help="show time in mean solar time")
     ap.add_argument("-u", "--utc", action="store_true", help="show time in UTC")
     ap.add_argument("-z", "--zone", type=int, help="show times in given integer timezone (+03, -6)")
-    ap.add_argument("--limits", choices=limits.keys() | {"all"},
+    ap.add_argument("--limits", choices=LIMIT_CHOICES,
                     default="sunrise",
                     help="which lightness-level to calculate")
     ap.add_argument("latitude", type=float, help="latitude (degrees) of the sunrise location")
@@ -125,19 +241,8 @@ if __name__ == "__main__":
     ap.add_argument("-v", "--verbose", action="count", default=0, help="be more verbose. Can be used multiple times")
     args = ap.parse_args()
 
-    times = collections.OrderedDict()
-    if args.solar:
-        times["solar"] = None
-    if args.mean:
-        times["mean"] = None
-    if args.utc:
-        times["utc"] = None
-    if args.zone != None:
-        times["zone"] = args.zone
-
     if args.list_limits:
-        for limit in limits.values():
-            print("{id: <12} {description: <61} ({angle: >4} degrees below the horizon)".format(**limit._asdict()))
+        sys.stdout.write("\n".join(f"{limit.id: <12} {limit.description: <61} ({limit.angle: >4} degrees below the horizon)" for limit in limits.values()) + "\n")
         sys.exit(0)
     if args.date:
         try:
@@ -148,9 +253,61 @@ if __name__ == "__main__":
             sys.exit(1)
     else:
         dt = datetime.date.today()
+    lat_rad = math.radians(args.latitude)
+    lng_rad = math.radians(args.longtitude)
+    sin_lat, cos_lat = _sincos(lat_rad)
+
+    if args.range:
+        if args.limits == "all":
+            print("--range works with a single limit")
+            sys.exit(1)
+        try:
+            import dateutil.parser
+            start = dateutil.parser.parse(args.range[0]).date()
+            end = dateutil.parser.parse(args.range[1]).date()
+        except ImportError:
+            print("To parse dates, install python-dateutil")
+            sys.exit(1)
+        n_days = end.toordinal() - start.toordinal() + 1
+        if n_days < 1:
+            print("END lies before START")
+            sys.exit(1)
+        limit = limits[args.limits]
+        try:
+            rise, sset = sunrise_range(start, n_days, lat_rad, lng_rad, -limit.angle_rad)
+        except ImportError:
+            print("To compute date ranges, install numpy")
+            sys.exit(1)
+        out = []
+        for i in range(n_days):
+            day = datetime.date.fromordinal(start.toordinal() + i).isoformat()
+            if math.isnan(rise[i]):
+                out.append(f"{day}  --:--:--  --:--:--")
+            else:
+                out.append(f"{day}  {format_hour_angle(rise[i])}  {format_hour_angle(sset[i])}")
+        sys.stdout.write("\n".join(out) + "\n")
+        sys.exit(0)
+
+    # resolve the requested time formats to (noon angle, label) pairs once
+    eot = equation_of_time(dt)
+    noon_utc = HALF_TAU - lng_rad - eot
+    times = []
+    if args.solar:
+        times.append((HALF_TAU, "solar time"))
+    if args.mean:
+        times.append((HALF_TAU - eot, "mean solar time"))
+    if args.utc:
+        times.append((noon_utc, "UTC"))
+    if args.zone != None:
+        times.append((noon_utc + args.zone * HOUR_ANGLE, f"{args.zone:+03}"))
+    if not times:
+        times = [(noon_utc, "UTC")]
+
     if args.limits == "all":
+        out = []
         for limit in limits.values():
-            print_limits(dt, limit, rad_from_deg(args.latitude), rad_from_deg(args.longtitude), times=times, verbose=args.verbose)
-            print()
+            out.extend(format_limits(dt, limit, sin_lat, cos_lat, times, verbose=args.verbose))
+            out.append("")
+        sys.stdout.write("\n".join(out) + "\n")
     else:
-        print_limits(dt, limits[args.limits], rad_from_deg(args.latitude), rad_from_deg(args.longtitude), times=times, verbose=args.verbose)
+        print_limits(dt, limits[args.limits], sin_lat, cos_lat, times, verbose=args.verbose)